@@ -45,6 +45,37 @@ class Model:
             elif mu: output.add((leaf, mu) if mode == "fuzzy" else leaf)
         return output
 
+    def membership_batch(self, X, mode):
+        """
+        Vectorised equivalent of Node.membership across all samples in X and all leaves,
+        returning an array of shape (num samples, num leaves). Each element of X must be a
+        scalar, or NaN to ignore that dim; use propagate() for (min, max) intervals.
+        """
+        X = np.array(X, dtype=float).reshape(-1, len(self.space))[:,None,:] # Broadcast across leaves.
+        marg = np.isnan(X)
+        if mode == "mean":
+            mean = np.array([leaf.mean for leaf in self.leaves])[None]
+            return np.all((X == mean) | marg, axis=-1).astype(int)
+        bb_min, bb_max = (np.array([leaf.bb_min for leaf in self.leaves])[None],
+                          np.array([leaf.bb_max for leaf in self.leaves])[None])
+        if mode in ("min", "max"): # Inside bounding box.
+            bb = bb_min if mode == "min" else bb_max
+            return np.all(((X >= bb[...,0]) & (X <= bb[...,1])) | marg, axis=-1).astype(int)
+        elif mode == "fuzzy": # Fuzzy membership using both bounding boxes.
+            to_max_l, to_max_u = X - bb_max[...,0], X - bb_max[...,1]
+            to_min_l, to_min_u = X - bb_min[...,0], X - bb_min[...,1]
+            above_min_l, below_min_u = (to_min_l >= 0), (to_min_u <= 0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                per_dim = np.where(marg | (above_min_l & below_min_u), 1., # Marginalised or inside bb_min.
+                          np.where(~above_min_l, to_max_l / (to_max_l - to_min_l), # Below lower of bb_min.
+                                                 to_max_u / (to_max_u - to_min_u))) # Above upper of bb_min.
+            per_dim[np.isnan(per_dim)] = 1. # Infinite bb_max gives inf/inf, for which the limit is 1.
+            mu = np.abs(per_dim.min(axis=-1)) # Compute total membership using the minimum T-norm.
+            # Zero membership if outside bb_max along any dim.
+            mu[np.any(~((to_max_l >= 0) & (to_max_u <= 0)) & ~marg, axis=-1)] = 0.
+            return mu
+        raise ValueError()
+
     def predict(self, X, dims, mode="min"): 
         """
         Propagate a set of samples through the model and get predictions along dims.
@@ -163,7 +194,4 @@ class Model:
         Clone this model, retaining only the reference to the space.
         """
         from copy import deepcopy
-        clone = deepcopy(self)
-        clone.space = self.space
-        for leaf in clone.leaves: leaf.space = self.space
-        return clone
\ No newline at end of file
+        return deepcopy(self, memo={id(self.space): self.space}) # Memo prevents copying the space.
\ No newline at end of file
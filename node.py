@@ -1,13 +1,15 @@
 from .utils import *
 import numpy as np
-import bisect
-from sklearn.decomposition import PCA
 
 class Node:
     """
     Class for a node, which is characterised by its samples (sorted_indices of data from space), 
     mean, covariance matrix and minimal and maximal bounding boxes. 
     """
+    # Declaring slots reduces per-node memory and speeds up attribute access in deep trees.
+    __slots__ = ("space", "bb_max", "bb_min", "split_dim", "split_threshold", "left", "right", "gains", "meta", 
+                 "sorted_indices", "num_samples", "mean", "cov", "cov_sum", "var_sum", "subtree_size", "_quantiles", "_id_set")
+
     def __init__(self, space, sorted_indices=None, bb_min=None, bb_max=None, meta={}):
         self.space = space # To refer back to the space class.     
         self.bb_max = np.array(bb_max if bb_max is not None else # If a maximal bounding box has been provided, use that.
@@ -25,37 +27,45 @@ class Node:
     # Dunder/magic methods.
     def __repr__(self): return f"Node with {self.num_samples} samples"
     def __call__(self, *args, **kwargs): return self.membership(*args, **kwargs)
-    def __len__(self): return len(self.sorted_indices)
+    def __len__(self): return self.sorted_indices.shape[1]
     def __getitem__(self, key): 
-        try: return self.__getattribute__(key) # For declared attributes (e.g. self.bb_max).
-        except:
-            if type(key) == tuple: 
-                try: return self.stat(key) # For statistical attributes.
-                except: pass
-            try: return self.meta[key] # For meta attributes.
-            except: return self.data(key) # For data dims.
+        if isinstance(key, str):
+            try: return getattr(self, key) # For declared attributes (e.g. self.bb_max).
+            except AttributeError: pass
+        elif isinstance(key, tuple): 
+            try: return self.stat(key) # For statistical attributes.
+            except: pass
+        try: return self.meta[key] # For meta attributes.
+        except: return self.data(key) # For data dims.
     def __setitem__(self, key, val): self.meta[key] = val
-    def __contains__(self, idx): return idx in self.sorted_indices[:,0] 
+    def __contains__(self, idx): 
+        if self._id_set is None: self._id_set = frozenset(self.sorted_indices[0].tolist()) # Built on first query.
+        return idx in self._id_set
 
     def data(self, *dims): 
         if dims: num_dims = len(dims)
         else: dims = None; num_dims = len(self.space)
-        return self.space.data[self.sorted_indices[:,0][:,None], self.space.idxify(dims)].reshape(-1,num_dims)
+        return self.space.data[self.sorted_indices[0][:,None], self.space.idxify(dims)].reshape(-1,num_dims)
     
     def populate(self, sorted_indices, keep_bb_min):
         """
         Populate the node with samples and compute statistics.
         """
-        if sorted_indices is None: sorted_indices = np.empty((0, len(self.space)))
+        if sorted_indices is None: sorted_indices = np.empty((len(self.space), 0), dtype=int)
         self.sorted_indices = sorted_indices
-        self.num_samples, num_dims = sorted_indices.shape
+        self._quantiles = {} # Cache for quantile-based stats, which are costly to compute.
+        self._id_set = None # Set of sample indices for membership queries, built on demand.
+        num_dims, self.num_samples = sorted_indices.shape
         if self.num_samples > 0: 
             X = self.data() # Won't actually store this; order doesn't matter.
-            self.mean = np.mean(X, axis=0)
+            self.mean = np.mean(X, axis=0, dtype=float) # Keep statistics in float64 whatever the data dtype.
             # Minimal bounding box is defined by the samples.
             if not keep_bb_min: self.bb_min = np.array([np.min(X, axis=0), np.max(X, axis=0)]).T
             if self.num_samples > 1:
-                self.cov = np.cov(X, rowvar=False, ddof=0) # ddof=0 overrides bias correction.                
+                # X is already a copy, so centre in place rather than letting np.cov make another.
+                # NumPy dispatches X.T @ X to a symmetric rank-k update (syrk).
+                X = X.astype(float, copy=False); X -= self.mean
+                self.cov = (X.T @ X) / self.num_samples # Equivalent to ddof=0.
         else: 
             self.mean = np.full(num_dims, np.nan)
             if not keep_bb_min: self.bb_min = np.full((num_dims, 2), np.nan)
@@ -129,7 +139,9 @@ class Node:
         if attr[0] == 'std_c': return np.sqrt(self.cov[dim,dim2])
         if attr[0] in ('median','iqr','q1q3'):
             # Median, interquartile range, or lower and upper quartiles.
-            q1, q2, q3 = np.quantile(self.space.data[self.sorted_indices[:,dim],dim], (.25,.5,.75))
+            if dim not in self._quantiles:
+                self._quantiles[dim] = np.quantile(self.space.data[self.sorted_indices[dim],dim], (.25,.5,.75))
+            q1, q2, q3 = self._quantiles[dim]
             if attr[0] == 'median': return q2
             if attr[0] == 'iqr': return q3-q1
             if attr[0] == 'q1q3': return (q1,q3)
@@ -142,18 +154,22 @@ class Node:
         """
         if dims is None: dims = np.arange(len(self.space))
         else: dims = self.space.idxify(dims)
-        X = self.space.data[self.sorted_indices[:,0][:,None],dims]
+        X = self.space.data[self.sorted_indices[0][:,None],dims]
         if X.shape[0] <= 1: return None, None
-        # Whiten data, using either local or global standard deviation.
-        mean = X.mean(axis=0)
-        std = X.std(axis=0) if whiten_by == 'local' else (1 / (self.space.global_var_scale[dims] ** 0.5))   
+        # Whiten data, using either local or global standard deviation. 
+        # Local statistics are already stored from populate(), so no extra passes over X are needed.
+        std = np.sqrt(np.diag(self.cov)[dims]) if whiten_by == 'local' else (1 / (self.space.global_var_scale[dims] ** 0.5))   
         std[std==0] = 1. # Prevent div/0 error.
-        X = (X - mean) / std
-        # Perform PCA on whitened data.
-        pca = PCA(n_components=n_components); pca.fit(X)
+        # X is already a copy, so whiten in place.
+        X = X.astype(float, copy=False); X -= self.mean[dims]; X /= std
+        # Perform PCA on whitened data via SVD of the data matrix itself, avoiding forming the covariance.
+        _, s, Vt = np.linalg.svd(X, full_matrices=False)
+        # Flip signs so that the largest-magnitude loading of each component is positive (as in sklearn).
+        Vt *= np.sign(Vt[np.arange(len(Vt)), np.argmax(np.abs(Vt), axis=1)])[:,None]
+        var = s**2
         # Return components scaled back by standard deviation, and explained variance ratio.
-        # pca.components_ has dimensionality (n_components, len(self.space)), so each component is a row vector.
-        return (pca.components_ * std), pca.explained_variance_ratio_
+        # Vt has dimensionality (n_components, len(self.space)), so each component is a row vector.
+        return (Vt[:n_components] * std), (var / var.sum())[:n_components]
 
     def json(self, *attributes, clip=None): 
         """
@@ -177,13 +193,14 @@ class Node:
             if not(self.bb_max[split_dim][0] <= split_threshold <= self.bb_max[split_dim][1]): return False
             self.split_dim, self.split_threshold = split_dim, split_threshold
             # Split samples.
-            data = self.space.data[self.sorted_indices[:,self.split_dim], self.split_dim]
-            split_index = bisect.bisect(data, self.split_threshold)
+            data = self.space.data[self.sorted_indices[self.split_dim], self.split_dim]
+            split_index = int(np.searchsorted(data, self.split_threshold, side="right"))
             left, right = split_sorted_indices(self.sorted_indices, self.split_dim, split_index)
         else:
             self.split_dim = split_dim
             left, right = split_sorted_indices(self.sorted_indices, self.split_dim, split_index)
-            self.split_threshold = (self.space.data[left[-1,split_dim],split_dim] + self.space.data[right[0,split_dim],split_dim]) / 2
+            # Store as a Python float (float64) regardless of data dtype.
+            self.split_threshold = (float(self.space.data[left[split_dim,-1],split_dim]) + float(self.space.data[right[split_dim,0],split_dim])) / 2
         # Split bounding box.
         bb_max_left = self.bb_max.copy(); bb_max_left[self.split_dim,1] = self.split_threshold
         bb_max_right = self.bb_max.copy(); bb_max_right[self.split_dim,0] = self.split_threshold
@@ -194,60 +211,83 @@ class Node:
         if gains is not None: self.gains["immediate"] = gains
         return True
 
-    def _find_greedy_split(self, split_dims, eval_dims, min_samples_leaf):
+    def _find_greedy_split(self, split_dims, eval_dims, min_samples_leaf, eval_var_scale=None):
         """
         Find the overall greediest split given split_dims and eval_dims.
+        eval_var_scale can be precomputed as self.space.global_var_scale[eval_dims] to avoid regathering.
         """
-        # Only attempt to split if there are enough samples.
-        if len(self) >= 2*min_samples_leaf:
-            splits, gains = self._find_greedy_split_per_dim(split_dims, eval_dims, min_samples_leaf)
+        # Only attempt to split if there are enough samples, and some variance along eval_dims to reduce.
+        if len(self) >= max(2*min_samples_leaf, 2) and np.any(self.var_sum[eval_dims] > 0):
+            splits, gains = self._find_greedy_split_per_dim(split_dims, eval_dims, min_samples_leaf, eval_var_scale)
             if splits:
                 # Sort splits by quality and choose the single best.
                 split_dim, split_index, qual = sorted(splits, key=lambda x: x[2], reverse=True)[0]        
                 return split_dim, split_index, qual, gains
         return None, None, -np.inf, None 
 
-    def _find_greedy_split_per_dim(self, split_dims, eval_dims, min_samples_leaf):
+    def _find_greedy_split_per_dim(self, split_dims, eval_dims, min_samples_leaf, eval_var_scale=None):
         """
         Try splitting the node along several split_dims, measuring quality using eval_dims.  
         Return the best split from each dim.
         """
+        if eval_var_scale is None: eval_var_scale = self.space.global_var_scale[eval_dims]
+        # Gather data columns and node statistics for eval_dims once, rather than for every split_dim.
+        eval_data = self.space._eval_data(eval_dims)
+        eval_mean, eval_var_sum = self.mean[eval_dims], self.var_sum[eval_dims]
         splits, greedy_gains = [], []
-        for split_dim in split_dims:
-            # Apply two kinds of constraint to the split point:
+        split_dims = np.asarray(split_dims)
+        # Apply two kinds of constraint to the split point along each dim:
+        valid = np.zeros((len(split_dims), self.num_samples+1), dtype=bool)
+        for i, split_dim in enumerate(split_dims):
+            # Cannot split along a dim on which all samples are equal, so leave all invalid.
+            if not self.var_sum[split_dim] > 0: continue
             #   (1) Must be a "threshold" point where the samples either side do not have equal values.
-            valid_split_indices = np.unique(self.space.data[self.sorted_indices[:,split_dim][:,None],split_dim], return_index=True)[1]
-            #   (2) Must obey min_samples_leaf.
-            valid_split_indices = [s for s in valid_split_indices if s >= min_samples_leaf and s <= self.num_samples-min_samples_leaf]
+            valid[i, np.unique(self.space.data[self.sorted_indices[split_dim][:,None],split_dim], return_index=True)[1]] = True
+        #   (2) Must obey min_samples_leaf.
+        valid[:,:min_samples_leaf] = False; valid[:,self.num_samples-min_samples_leaf+1:] = False
+        splittable = valid.any(axis=1)
+        if numba is not None: 
+            # If Numba is available, find the best split along every splittable dim using a parallel compiled Welford loop.
+            best = dict(zip(split_dims[splittable], zip(*welford_best_splits(eval_data, self.sorted_indices, split_dims[splittable], 
+                eval_mean, eval_var_sum, eval_var_scale.astype(float), valid[splittable]))))
+        for i, split_dim in enumerate(split_dims):
             # Cannot split on a dim if there are no valid split points, so skip.
-            if valid_split_indices == []: greedy_gains.append(np.full(len(eval_dims), np.nan)); continue
-            # Evaluate splits along this dim, returning variance sums.
-            var_sum = self._eval_splits_one_dim(split_dim, eval_dims, min_samples_leaf)
-            # Split quality = sum of reduction in dimensions-scaled variance sums.
-            gains_this_dim = var_sum[1,0] - var_sum[:,valid_split_indices,:].sum(axis=0)
-            qual = (gains_this_dim * self.space.global_var_scale[eval_dims]).sum(axis=1)
-            # Greedy split is the one with the highest quality.
-            greedy = np.argmax(qual)      
-            split_index = valid_split_indices[greedy]   
-            qual_max = qual[greedy]
-            greedy_gains.append(gains_this_dim[greedy]) 
+            if not splittable[i]: greedy_gains.append(np.full(len(eval_dims), np.nan)); continue
+            if numba is not None: split_index, qual_max, gains = best[split_dim]
+            else:
+                valid_split_indices = np.flatnonzero(valid[i])
+                # Evaluate splits along this dim, returning variance sums.
+                var_sum = self._eval_splits_one_dim(split_dim, eval_dims, min_samples_leaf, eval_data, eval_mean)
+                # Split quality = sum of reduction in dimensions-scaled variance sums.
+                gains_this_dim = var_sum[1,0] - var_sum[:,valid_split_indices,:].sum(axis=0)
+                qual = (gains_this_dim * eval_var_scale).sum(axis=1)
+                # Greedy split is the one with the highest quality.
+                greedy = np.argmax(qual)      
+                split_index, qual_max, gains = valid_split_indices[greedy], qual[greedy], gains_this_dim[greedy]
+            greedy_gains.append(gains) 
             # Store split info.
             splits.append((split_dim, split_index, qual_max))
         return splits, np.array(greedy_gains)
 
-    def _eval_splits_one_dim(self, split_dim, eval_dims, min_samples_leaf):
+    def _eval_splits_one_dim(self, split_dim, eval_dims, min_samples_leaf, eval_data=None, eval_mean=None):
         """
         Try splitting the node along one split_dim, calculating variance sums along eval_dims.  
+        Uses cumulative first and second moments, so all split points are evaluated at once.
+        eval_data and eval_mean can be pregathered for eval_dims by the caller.
         """
-        eval_data = self.space.data[self.sorted_indices[:,split_dim][:,None],eval_dims] 
-        d = len(eval_dims)
-        mean = np.zeros((2,self.num_samples+1,d))
-        var_sum = mean.copy()
-        var_sum[1,0] = self.var_sum[eval_dims]
-        mean[1,0] = self.mean[eval_dims] 
-        for num_left in range(1,(self.num_samples+1)-min_samples_leaf): 
-            num_right = self.num_samples - num_left
-            x = eval_data[num_left-1]
-            mean[0,num_left], var_sum[0,num_left] = increment_mean_and_var_sum(num_left,  mean[0,num_left-1], var_sum[0,num_left-1], x, 1)
-            mean[1,num_left], var_sum[1,num_left] = increment_mean_and_var_sum(num_right, mean[1,num_left-1], var_sum[1,num_left-1], x, -1)            
-        return var_sum
\ No newline at end of file
+        if eval_data is None: eval_data = self.space._eval_data(eval_dims)
+        if eval_mean is None: eval_mean = self.mean[eval_dims]
+        # Centre on the node mean to limit cancellation error in the second moment.
+        eval_data = eval_data[self.sorted_indices[split_dim]] - eval_mean.astype(eval_data.dtype)
+        zeros = np.zeros(len(eval_dims), dtype=eval_data.dtype)
+        # Sums and sums of squares for the left child, for every possible num_left (including zero).
+        sum_left = np.vstack((zeros, np.cumsum(eval_data, axis=0)))
+        sq_sum_left = np.vstack((zeros, np.cumsum(eval_data**2, axis=0)))
+        # Right child is the complement.
+        sum_right, sq_sum_right = sum_left[-1] - sum_left, sq_sum_left[-1] - sq_sum_left
+        num_left = np.arange(self.num_samples+1, dtype=eval_data.dtype)[:,None]
+        num_right = self.num_samples - num_left
+        # var_sum = sum(x^2) - sum(x)^2 / n. Dividing by max(n,1) handles empty children, whose sums are zero.
+        var_sum = np.array([sq_sum_left  - sum_left**2  / np.maximum(num_left, 1),
+                            sq_sum_right - sum_right**2 / np.maximum(num_right, 1)])
+        return np.maximum(var_sum, 0) # Clip at zero.
@@ -4,13 +4,23 @@ from .node import Node
 from .utils import *
 import numpy as np
 from tqdm import tqdm
+import ast
+import textwrap
+from weakref import WeakKeyDictionary
+from collections import OrderedDict
+
+_parsed_funcs = WeakKeyDictionary() # Cache of parsed function definitions for Space.tree_from_func.
 
 class Space:
     """
     Master class for centrally storing data and building models within a vector space.
     """
-    def __init__(self, dim_names, data=None):
+    subset_cache_size = 32 # Maximum number of sorted_indices arrays cached by subset().
+    eval_data_cache_size = 4 # Maximum number of column subsets cached by _eval_data().
+
+    def __init__(self, dim_names, data=None, dtype=None):
         self.dim_names = dim_names
+        self.dtype = dtype # If specified (e.g. np.float32 to halve memory traffic during splitting), data are cast to this.
         if data is None: data = np.empty((0, len(dim_names))) 
         self.data = data
         # Empty dictionary for storing models.
@@ -22,9 +32,12 @@ class Space:
     @data.setter
     def data(self, data):
         assert data.shape[1] == len(self)
+        if self.dtype is not None: data = data.astype(self.dtype, copy=False)
         self._data = data
-        # Sort data along each dimension up front.
-        self.all_sorted_indices = np.argsort(data, axis=0) 
+        self._eval_data_cache, self._subset_cache = OrderedDict(), OrderedDict() # Invalidate cached subsets.
+        # Sort data along each dimension up front. Store with shape (num dims, num samples) so that 
+        # each dim's ordering is contiguous, using int32 where possible to halve memory.
+        self.all_sorted_indices = np.argsort(data, axis=0).T.astype(np.int32 if data.shape[0] < 2**31 else np.int64, order="C")
         if data.shape[0]:
             # Scale factors for variance are reciprocals of global variance.
             var = np.var(data, axis=0)
@@ -37,13 +50,31 @@ class Space:
     def __getitem__(self, name): return self.models[name]
     def __len__(self): return len(self.dim_names)
 
-    def subset(self, bb=None, subsample=None):
+    def subset(self, bb=None, subsample=None, seed=None):
         """
         Retrieve a subset of the data by per-dimension filtering and/or random subsampling.
+        Results are cached, except for subsamples drawn without a seed. Returned arrays may 
+        therefore be shared, so should not be modified in place.
+        """
+        if bb is None: key, sorted_indices = None, self.all_sorted_indices
+        else:
+            key = tuple(None if lims is None else tuple(lims) for lims in self.listify(bb))
+            sorted_indices = self._lru_cached(self._subset_cache, self.subset_cache_size, key, 
+                                              lambda: bb_filter_sorted_indices(self, self.all_sorted_indices, bb))
+        if subsample is None or seed is None: return subsample_sorted_indices(sorted_indices, subsample)
+        return self._lru_cached(self._subset_cache, self.subset_cache_size, (key, subsample, seed), 
+                                lambda: subsample_sorted_indices(sorted_indices, subsample, seed))
+
+    def _lru_cached(self, cache, size, key, make):
         """
-        sorted_indices = self.all_sorted_indices
-        if bb is not None: sorted_indices = bb_filter_sorted_indices(self, sorted_indices, bb)
-        return subsample_sorted_indices(sorted_indices, subsample)
+        Retrieve key from a least-recently-used cache (an OrderedDict), calling make() on a miss
+        and evicting the oldest entry if the cache grows beyond size.
+        """
+        if key in cache: cache.move_to_end(key)
+        else:
+            cache[key] = make()
+            if len(cache) > size: cache.popitem(last=False)
+        return cache[key]
 
     def tree_depth_first(self, name, split_dims, eval_dims, sorted_indices=None, 
                          max_depth=np.inf, min_samples_leaf=1, corr=False, one_sided=False, pop_power=.5):
@@ -125,7 +156,7 @@ class Space:
             for v in d.values(): v["split_dim"] = redim[v["split_dim"]]
         def _recurse(node, n): 
             if n in d:
-                if not node._do_manual_split(d[n]["split_dim"], split_threshold=d[n]["split_threshold"]):
+                if not node._do_split(d[n]["split_dim"], split_threshold=d[n]["split_threshold"]):
                     raise ValueError(f"Invalid split threshold for node {n}: \"{d[n]}\".")
                 _recurse(node.left, d[n]["left"])
                 _recurse(node.right, d[n]["right"])
@@ -138,31 +169,41 @@ class Space:
     def tree_from_func(self, name, func):
         """
         Create a tree from a well-formed nested if-then function in Python.
-        Tests must use the < operator; split_dims can either be identified with indices, e.g. x[0],
+        Tests must use the < or >= operator; split_dims can either be identified with indices, e.g. x[0],
         or with a valid entry in self.dim_names.
         """
-        from dill.source import getsource
-        lines = [l.strip() for l in getsource(func).split("\n")[:-1]]
-        assert lines[0][:3] == "def"
-        def _recurse(node, n):
-            if lines[n][0] == "#": return _recurse(node, n + 1) 
-            elif lines[n][:2] == "if":
-                d, o, t = lines[n][3:-1].split(" ")
-                assert o in ("<", ">=")
-                try: split_dim = int(d.split("[")[1][:-1]) # If index specified.
-                except: split_dim = self.dim_names.index(d) # If dim_name specified.
+        # Parse the function with ast, caching the result until the function's code changes.
+        code, func_def, lines = _parsed_funcs.get(func, (None, None, None))
+        if code is not func.__code__:
+            from dill.source import getsource
+            source = textwrap.dedent(getsource(func))
+            func_def, lines = ast.parse(source).body[0], source.split("\n")
+            assert isinstance(func_def, ast.FunctionDef)
+            _parsed_funcs[func] = (func.__code__, func_def, lines)
+        def _recurse(node, body):
+            stmt = next((s for s in body if not isinstance(s, ast.Expr)), None) # Skip docstrings.
+            if stmt is None: 
+                raise ValueError(f"Parse error at line {body[0].lineno}: \"{lines[body[0].lineno-1].strip()}\".")
+            if isinstance(stmt, ast.If):
+                test = stmt.test
+                assert isinstance(test, ast.Compare) and len(test.ops) == 1 and type(test.ops[0]) in (ast.Lt, ast.GtE)
+                if isinstance(test.left, ast.Subscript): # If index specified.
+                    index = test.left.slice
+                    if isinstance(index, getattr(ast, "Index", ())): index = index.value # Python < 3.9 wraps the index.
+                    split_dim = ast.literal_eval(index)
+                else: split_dim = self.dim_names.index(test.left.id) # If dim_name specified.
                 split_dims.add(split_dim)
-                if not node._do_manual_split(split_dim, split_threshold=float(t)):
-                    raise ValueError(f"Invalid split threshold at line {n}: \"{lines[n]}\".")
-                n = _recurse(node.left if o == "<" else node.right, n + 1)
-                assert lines[n] == "else:"
-                n = _recurse(node.right if o == "<" else node.left, n + 1)
-            elif lines[n][:6] == "return": n += 1 # NOTE: Not doing anything with returns.
-            else: raise ValueError(f"Parse error at line {n}: \"{lines[n]}\".")
-            return n
+                if not node._do_split(split_dim, split_threshold=float(ast.literal_eval(test.comparators[0]))):
+                    raise ValueError(f"Invalid split threshold at line {stmt.lineno}: \"{lines[stmt.lineno-1].strip()}\".")
+                lt = isinstance(test.ops[0], ast.Lt)
+                assert stmt.orelse, f"Missing else at line {stmt.lineno}."
+                _recurse(node.left if lt else node.right, stmt.body)
+                _recurse(node.right if lt else node.left, stmt.orelse)
+            elif not isinstance(stmt, ast.Return): # NOTE: Not doing anything with returns.
+                raise ValueError(f"Parse error at line {stmt.lineno}: \"{lines[stmt.lineno-1].strip()}\".")
         split_dims, eval_dims = set(), [] # NOTE: No eval dims.
         root = Node(self, sorted_indices=self.all_sorted_indices)
-        _recurse(root, 1)
+        _recurse(root, func_def.body)
         self.models[name] = Tree(name, root, sorted(split_dims), eval_dims)
         return self.models[name]
 
@@ -202,6 +243,15 @@ class Space:
             dim_lists.append(dim_list)
         return dim_lists if len(dim_lists) > 1 else dim_lists[0]
 
+    def _eval_data(self, eval_dims):
+        """
+        Return a contiguous floating-point copy of the data columns for eval_dims, cached so 
+        that split evaluation only needs to gather rows. Split evaluation uses this dtype.
+        """
+        key = tuple(eval_dims)
+        return self._lru_cached(self._eval_data_cache, self.eval_data_cache_size, key, lambda: 
+            np.ascontiguousarray(self.data[:,list(key)], dtype=np.result_type(self.data, np.float32)))
+
     def _preflight_check(self, split_dims, eval_dims, sorted_indices):
         split_dims, eval_dims = self.idxify(split_dims, eval_dims)
         # If indices not specified, use all.
@@ -1,6 +1,7 @@
 from .model import Model
 from .utils import *
 import numpy as np
+import heapq
 
 class Tree(Model):
     """
@@ -18,10 +19,19 @@ class Tree(Model):
     def _compute_split_queue(self):
         """
         Compute split queue for best-first growth from scratch, and empty split cache.
+        Also cache the global variance scale factors for eval_dims, which are reused for every split.
+        Both the queue and cache are heaps of (-priority, push_count, node, ...) tuples.
         """
-        self.split_queue = [(leaf, np.dot(leaf.var_sum[self.eval_dims], self.space.global_var_scale[self.eval_dims])) for leaf in self.leaves]
-        self.split_queue.sort(key=lambda x: x[1], reverse=True)
-        self.split_cache = []
+        self.eval_var_scale = self.space.global_var_scale[self.eval_dims]
+        self.split_queue, self.split_cache, self._push_count = [], [], 0
+        for leaf in self.leaves: self._push(self.split_queue, np.dot(leaf.var_sum[self.eval_dims], self.eval_var_scale), leaf)
+
+    def _push(self, heap, priority, *items):
+        """
+        Push onto a max-heap. The push count breaks ties in insertion order, and means nodes are never compared.
+        """
+        heapq.heappush(heap, (-priority, self._push_count, *items))
+        self._push_count += 1
 
     def populate(self, sorted_indices="all", keep_bb_min=False): 
         """
@@ -35,7 +45,7 @@ class Tree(Model):
             if node.split_dim is None: return
             if sorted_indices is None: left, right = None, None
             else:
-                split_index = bisect.bisect(self.space.data[si[:,node.split_dim], node.split_dim], node.split_threshold)
+                split_index = int(np.searchsorted(self.space.data[si[node.split_dim], node.split_dim], node.split_threshold, side="right"))
                 left, right = split_sorted_indices(si, node.split_dim, split_index)
             _recurse(node.left, left); _recurse(node.right, right)
         _recurse(self.root, sorted_indices)
@@ -82,10 +92,10 @@ class Tree(Model):
         """
         Find the greedy split for the first leaf in the split queue and add to the split cache.
         """
-        node, _ = self.split_queue.pop(0) 
-        self.split_cache.append((node, node._find_greedy_split(self.split_dims, self.eval_dims, min_samples_leaf)))
-        self.split_cache.sort(key=lambda x: x[1][2], reverse=True) 
-        assert set(self.leaves) == set([n for n, _ in self.split_queue]) | set([n for n, _ in self.split_cache])
+        _, _, node = heapq.heappop(self.split_queue)
+        split = node._find_greedy_split(self.split_dims, self.eval_dims, min_samples_leaf, self.eval_var_scale)
+        self._push(self.split_cache, split[2], node, split) # Prioritise by split quality.
+        assert set(self.leaves) == set([x[2] for x in self.split_queue]) | set([x[2] for x in self.split_cache])
 
     def split_next_best(self, min_samples_leaf, num_from_queue=np.inf): 
         """
@@ -98,16 +108,15 @@ class Tree(Model):
             self._queue_to_cache(min_samples_leaf) # Transfer the first leaf in the split queue to the cache.
             if len(self.split_queue) == 0: break
             n += 1
-        node, (split_dim, split_index, qual, gains) = self.split_cache.pop(0)        
+        _, _, node, (split_dim, split_index, qual, gains) = heapq.heappop(self.split_cache)
         if qual > 0: 
             node._do_split(split_dim, split_index=split_index, gains=gains)
             # If split made, store the two new leaves and add them to the queue.
             parent_index = self.leaves.index(node)
             self.leaves.pop(parent_index) # First remove the parent.
             self.leaves = self._get_nodes(leaves_only=True) # NOTE: Doing it this way preserves a consistent ordering scheme.
-            self.split_queue += [(node.left,  np.dot(node.left.var_sum[self.eval_dims], self.space.global_var_scale[self.eval_dims])),
-                                 (node.right, np.dot(node.right.var_sum[self.eval_dims], self.space.global_var_scale[self.eval_dims]))]
-            self.split_queue.sort(key=lambda x: x[1], reverse=True) # Sort ready for next time.
+            self._push(self.split_queue, np.dot(node.left.var_sum[self.eval_dims], self.eval_var_scale), node.left)
+            self._push(self.split_queue, np.dot(node.right.var_sum[self.eval_dims], self.eval_var_scale), node.right)
             return parent_index, node.split_dim, node.split_threshold
         return None
 
@@ -177,7 +186,7 @@ class Tree(Model):
         # Subfunction for calculating costs is similar to the _recurse() function inside backprop_gains(),
         # except it takes the weighted sum of var_sum rather than per-feature, and realised only.
         def _recurse(node):
-            var_sum = np.dot(node.var_sum[self.eval_dims], self.space.global_var_scale[self.eval_dims])
+            var_sum = np.dot(node.var_sum[self.eval_dims], self.eval_var_scale)
             if node.split_dim is None: return [var_sum], 1
             (left, num_left), (right, num_right) = _recurse(node.left), _recurse(node.right)
             var_sum_leaves, num_leaves = left + right, num_left + num_right
@@ -228,14 +237,7 @@ class Tree(Model):
         Clone this tree, retaining only the reference to the space.
         """
         from copy import deepcopy
-        clone = deepcopy(self)
-        clone.space = self.space
-        def _recurse(node):
-            node.space = self.space
-            if node.split_dim is None: return
-            _recurse(node.left); _recurse(node.right)
-        _recurse(clone.root)
-        return clone
+        return deepcopy(self, memo={id(self.space): self.space}) # Memo prevents copying the space.
 
     def _get_nodes(self, source=None, leaves_only=False):
         nodes = []
@@ -1,6 +1,7 @@
 import numpy as np
-import bisect
 from itertools import product
+try: import numba # Optional; used to compile the split evaluation loop.
+except ImportError: numba = None
 
 # ===============================
 # OPERATIONS USED FOR VARIANCE-BASED SPLITTING
@@ -16,6 +17,58 @@ def increment_mean_and_var_sum(n, mean, var_sum, x, sign):
     var_sum = var_sum + (sign * (d_last * d))
     return mean, np.maximum(var_sum, 0) # Clip at zero.
 
+def welford_var_sums(eval_data, mean, var_sum):
+    """
+    Sweep a split point through eval_data (sorted along the split dim), applying the 
+    same Welford update as increment_mean_and_var_sum to add each sample to the left 
+    child and remove it from the right. Compiled with Numba if available.
+    Means and var_sums are accumulated in float64 whatever the dtype of eval_data, since 
+    downdating the right child from the parent total is too lossy in float32.
+    """
+    num_samples, d = eval_data.shape
+    var_sums = np.zeros((2, num_samples+1, d))
+    var_sums[1,0] = var_sum
+    mean_left, mean_right = np.zeros(d), mean.astype(np.float64)
+    for num_left in range(1, num_samples+1):
+        num_right = num_samples - num_left
+        for j in range(d):
+            x = eval_data[num_left-1,j]
+            d_last = x - mean_left[j]
+            mean_left[j] += d_last / num_left
+            var_sums[0,num_left,j] = max(var_sums[0,num_left-1,j] + d_last * (x - mean_left[j]), 0.)
+            if num_right == 0: continue # Right child is empty, so var_sum stays at zero.
+            d_last = x - mean_right[j]
+            mean_right[j] -= d_last / num_right
+            var_sums[1,num_left,j] = max(var_sums[1,num_left-1,j] - d_last * (x - mean_right[j]), 0.)
+    return var_sums
+
+if numba is not None: 
+    welford_var_sums = numba.njit(cache=True)(welford_var_sums)
+
+    @numba.njit(cache=True, parallel=True)
+    def welford_best_splits(eval_data, sorted_indices, split_dims, mean, var_sum, eval_var_scale, valid):
+        """
+        Apply welford_var_sums along every split_dim, in parallel across split_dims, and reduce each
+        to its highest-quality split among the indices marked in valid (shape (len(split_dims), num samples + 1)).
+        This means only one sweep's var_sums per thread is held in memory at a time.
+        eval_data contains all samples in the space, restricted to the eval_dims.
+        Return the best split index, quality and per-eval_dim gains for each split_dim.
+        """
+        num_split_dims, d = len(split_dims), eval_data.shape[1]
+        split_indices = np.zeros(num_split_dims, dtype=np.int64)
+        quals = np.full(num_split_dims, -np.inf)
+        gains = np.zeros((num_split_dims, d))
+        for i in numba.prange(num_split_dims):
+            var_sums = welford_var_sums(eval_data[sorted_indices[split_dims[i]]], mean, var_sum)
+            for k in np.flatnonzero(valid[i]):
+                # Split quality = sum of reduction in dimensions-scaled variance sums.
+                qual = 0.
+                for j in range(d): qual += (var_sums[1,0,j] - var_sums[0,k,j] - var_sums[1,k,j]) * eval_var_scale[j]
+                if qual > quals[i]: quals[i], split_indices[i] = qual, k
+            k = split_indices[i]
+            gains[i] = var_sums[1,0] - var_sums[0,k] - var_sums[1,k]
+        return split_indices, quals, gains
+
 # ===============================
 # OPERATIONS ON SORTED INDICES
 
@@ -24,14 +77,14 @@ def split_sorted_indices(sorted_indices, split_dim, split_index):
     Split a sorted_indices array at a point along one of the dimensions,
     preserving the order along all others.
     """
-    dims = range(sorted_indices.shape[1])
+    dims = range(sorted_indices.shape[0])
     left, right = [[] for _ in dims], [[] for _ in dims]
-    left[split_dim], right[split_dim] = np.split(sorted_indices[:,split_dim], [split_index])
+    left[split_dim], right[split_dim] = np.split(sorted_indices[split_dim], [split_index])
     for other_dim in dims:
-        put_left = np.in1d(sorted_indices[:,other_dim], left[split_dim])
-        left[other_dim] = sorted_indices[put_left, other_dim]
-        right[other_dim] = sorted_indices[np.logical_not(put_left), other_dim]
-    return np.array(left).T, np.array(right).T
+        put_left = np.in1d(sorted_indices[other_dim], left[split_dim])
+        left[other_dim] = sorted_indices[other_dim, put_left]
+        right[other_dim] = sorted_indices[other_dim, np.logical_not(put_left)]
+    return np.array(left), np.array(right)
 
 def bb_filter_sorted_indices(space, sorted_indices, bb):
     """
@@ -42,36 +95,38 @@ def bb_filter_sorted_indices(space, sorted_indices, bb):
         if lims is None: continue # If nothing specified for this lim.
         for lu, lim in enumerate(lims):
             if np.isfinite(lim):
-                data = space.data[sorted_indices[:,split_dim], split_dim] # Must reselect each time.
+                data = space.data[sorted_indices[split_dim], split_dim] # Must reselect each time.
                 if lu == 0:
                     # For lower limit, bisect to the right.
-                    split_index = bisect.bisect_right(data, lim)
+                    split_index = int(np.searchsorted(data, lim, side="right"))
                     _, sorted_indices = split_sorted_indices(sorted_indices, split_dim, split_index)
                 else:
                     # For upper limit, bisect to the left.
-                    split_index = bisect.bisect_left(data, lim)
+                    split_index = int(np.searchsorted(data, lim, side="left"))
                     sorted_indices, _ = split_sorted_indices(sorted_indices, split_dim, split_index)    
     return sorted_indices
 
-def subsample_sorted_indices(sorted_indices, size):
+def subsample_sorted_indices(sorted_indices, size, seed=None):
     """
     Subsample a sorted_indices array, preserving order.
+    If a seed is given, the subsample is reproducible.
     """
-    if size is None or size >= len(sorted_indices): return sorted_indices
-    dims = range(sorted_indices.shape[1])
-    subset_indices = np.random.choice(sorted_indices[:,0], replace=False, size=size)
+    if size is None or size >= sorted_indices.shape[1]: return sorted_indices
+    dims = range(sorted_indices.shape[0])
+    rng = np.random if seed is None else np.random.default_rng(seed)
+    subset_indices = rng.choice(sorted_indices[0], replace=False, size=size)
     subset = [[] for _ in dims]
     for dim in dims:
-        keep = np.in1d(sorted_indices[:,dim], subset_indices)
-        subset[dim] = sorted_indices[keep, dim]
-    return np.array(subset).T
+        keep = np.in1d(sorted_indices[dim], subset_indices)
+        subset[dim] = sorted_indices[dim, keep]
+    return np.array(subset)
 
 def dataframe(space, sorted_indices, index_col):
     """
     Convert a set of sorted indices into a Pandas dataframe.
     """
     import pandas as pd
-    return pd.DataFrame(space.data[sorted_indices[:,0]], columns=space.dim_names).set_index(index_col)
+    return pd.DataFrame(space.data[sorted_indices[0]], columns=space.dim_names).set_index(index_col)
 
 # ===============================
 # OPERATIONS ON BOUNDING BOXES
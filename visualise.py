@@ -11,7 +11,7 @@ def show_samples(node, vis_dims, colour_dim=None, alpha=1, spark=False, subsampl
     """
     assert len(vis_dims) in (2,3)
     vis_dims, colour_dim = node.space.idxify(vis_dims, colour_dim)
-    X_all_dims = node.space.data[subsample_sorted_indices(node.sorted_indices, subsample)[:,0]]
+    X_all_dims = node.space.data[subsample_sorted_indices(node.sorted_indices, subsample)[0]]
     X = X_all_dims[:, vis_dims]
     lims = [[X[:,0].min(), X[:,0].max()], [X[:,1].min(), X[:,1].max()]]
     if ax is None: 
@@ -222,7 +222,7 @@ def show_shap_dependence(tree, node, wrt_dim, shap_dim, vis_dim=None, deint_dim=
     if vis_dim is None: vis_dim = shap_dim
     shap_dim, wrt_dim, vis_dim, deint_dim, colour_dim = tree.space.idxify(shap_dim, wrt_dim, vis_dim, deint_dim, colour_dim)
     # Compute SHAP values for all samples.
-    X = node.space.data[subsample_sorted_indices(node.sorted_indices, subsample)[:,0]]
+    X = node.space.data[subsample_sorted_indices(node.sorted_indices, subsample)[0]]
     if deint_dim is None: 
         shaps = tree.shap(X, shap_dims=tree.split_dims, wrt_dim=wrt_dim, maximise=False)
         d = np.array(list(zip(X[:,vis_dim], 